@@ -1,7 +1,26 @@
 import pcbnew
 import wx
+import bisect
 from collections import defaultdict
+import itertools
 import os
+import re
+
+# Edge length of a spatial index grid cell, in internal units
+GRID_CELL_SIZE = pcbnew.FromMM(2)
+
+# Slack added around pad and zone bounding boxes, since ZONE::HitTest accepts
+# points up to this far outside the outline (at its corners)
+HITTEST_MARGIN = pcbnew.FromMM(0.2)
+
+# Item kinds, tagged once during collection
+KIND_TRACK = 0
+KIND_PAD = 1
+KIND_ZONE = 2
+
+# Pad numbers that are tied to GND instead of the group's new net
+SPECIAL_PAD_NUMBERS = frozenset(("0", "MP"))
+
 class AutoNetNamerPlugin(pcbnew.ActionPlugin):
     def defaults(self):
         self.name = "Auto Net Namer"
@@ -20,13 +39,21 @@ class AutoNetNamerPlugin(pcbnew.ActionPlugin):
         # Get all physically connected items without net names
         connected_items = self.find_connected_items(board)
         
-        # Collect all already used net names
-        used_net_names = {net.GetNetname() for net in board.GetNetInfo().NetsByNetcode().values() if net.GetNetname()}
-        
         net_prefix = "AUTO_"
+        
+        # Continue numbering after the highest existing AUTO_n net, reading the
+        # names straight from the keys of the board's name-to-net map
+        auto_name = re.compile(rf"{re.escape(net_prefix)}(\d+)$")
         counter = 1
+        for netname in board.GetNetInfo().NetsByName().keys():
+            match = auto_name.match(str(netname))
+            if match:
+                counter = max(counter, int(match.group(1)) + 1)
         named_connections = 0
         
+        # GND net for special pads, looked up once and created on first use
+        gnd = board.FindNet("GND")
+        
         # Create a new net for each connection group
         for connection_group in connected_items:
             if not connection_group:  # Skip empty groups
@@ -42,23 +69,18 @@ class AutoNetNamerPlugin(pcbnew.ActionPlugin):
                 continue
 
             # Create a new net name
-            while True:
-                new_name = f"{net_prefix}{counter}"
-                if new_name not in used_net_names:
-                    break
-                counter += 1
+            new_name = f"{net_prefix}{counter}"
+            counter += 1
                 
-            # Create the net and assign it to all connected items
-            new_net = board.FindNet(new_name)
-            if not new_net:
-                new_net = pcbnew.NETINFO_ITEM(board, new_name)
-                board.Add(new_net)
+            # Create the net and assign it to all connected items;
+            # the counter starts above every existing AUTO_n, so the name is free
+            new_net = pcbnew.NETINFO_ITEM(board, new_name)
+            board.Add(new_net)
 
             for item in connection_group:
                 if isinstance(item, pcbnew.PAD):
                     # Only assign a net to pads when they’re actually connected to conductors
-                    if item.GetNumber() in ["0", "MP"]:
-                        gnd = board.FindNet("GND")
+                    if item.GetNumber() in SPECIAL_PAD_NUMBERS:
                         if not gnd:
                             gnd = pcbnew.NETINFO_ITEM(board, "GND")
                             board.Add(gnd)
@@ -69,11 +91,9 @@ class AutoNetNamerPlugin(pcbnew.ActionPlugin):
                     # Tracks/zones always get the new net
                     item.SetNet(new_net)
                 
-            used_net_names.add(new_name)
-            counter += 1
             named_connections += 1
         
-        # Refresh the PCB display
+        # Refresh the PCB display once, after all board edits
         pcbnew.Refresh()
         
         # Display results
@@ -85,101 +105,214 @@ class AutoNetNamerPlugin(pcbnew.ActionPlugin):
 
     def find_connected_items(self, board):
         """Find all physically connected but unnamed items"""
-        # Get all items to check
+        # Get all items to check, and extract in the same pass their kind, their
+        # geometry as plain Python values (track endpoints as (x, y) int tuples,
+        # bounding boxes) and their layers, so adjacency discovery below runs
+        # without any pcbnew calls
         all_items = []
+        kinds = []
+        endpoints = []
+        bboxes = []
+        layers = []
+        
+        # HitTest results for this run, keyed by (item id, (x, y))
+        hittest_cache = {}
+        
+        candidates = itertools.chain(
+            ((track, KIND_TRACK) for track in board.GetTracks()),
+            ((zone, KIND_ZONE) for zone in board.Zones()),
+            ((pad, KIND_PAD) for footprint in board.GetFootprints() for pad in footprint.Pads()),
+        )
         
         # Collect all items with empty or default net names
-        for track in board.GetTracks():
-            net = track.GetNet()
-            if not net or not net.GetNetname():  # Detect empty net name
-                all_items.append(track)
-        
-        for zone in board.Zones():
-            net = zone.GetNet()
-            if not net or not net.GetNetname():  # Detect empty net name
-                all_items.append(zone)
-        
-        for footprint in board.GetFootprints():
-            for pad in footprint.Pads():
-                net = pad.GetNet()
-                if not net or not net.GetNetname():  # Detect empty net name
-                    all_items.append(pad)
-        
-        # Use a set to track visited items
-        visited = set()
-        connected_groups = []
-        
-        for item in all_items:
-            item_id = self.get_item_id(item)
-            if item_id in visited:
+        for item, kind in candidates:
+            netname = self.get_netname(item)
+            if netname:  # Skip items that already have a net name
                 continue
-                
-            # Use BFS to find all connected items
-            queue = [item]
-            connected_group = []
-            
-            while queue:
-                current = queue.pop(0)
-                current_id = self.get_item_id(current)
-                
-                if current_id in visited:
-                    continue
-                    
-                visited.add(current_id)
-                connected_group.append(current)
-                
-                # Find physically connected items
-                for other in all_items:
-                    other_id = self.get_item_id(other)
-                    if other_id in visited:
-                        continue
-                        
-                    if self.are_physically_connected(board, current, other):
-                        queue.append(other)
             
-            if connected_group:
-                connected_groups.append(connected_group)
+            track_endpoints = self.get_track_endpoints(item) if kind == KIND_TRACK else None
+            all_items.append(item)
+            kinds.append(kind)
+            endpoints.append(track_endpoints)
+            bboxes.append(self.get_item_bbox(item, track_endpoints))
+            # Items on disjoint copper layers never connect
+            layers.append(frozenset(layer for layer in item.GetLayerSet().Seq() if pcbnew.IsCopperLayer(layer)))
+        
+        track_edges, candidate_pairs = self.build_edges(kinds, endpoints, bboxes, layers)
+        
+        # Union-Find over item indices, with path compression and union by rank
+        parent = list(range(len(all_items)))
+        rank = [0] * len(all_items)
+        
+        def find(i):
+            root = i
+            while parent[root] != root:
+                root = parent[root]
+            while parent[i] != root:
+                parent[i], i = root, parent[i]
+            return root
+        
+        def union(i, j):
+            root_i, root_j = find(i), find(j)
+            if root_i == root_j:
+                return
+            if rank[root_i] < rank[root_j]:
+                root_i, root_j = root_j, root_i
+            parent[root_j] = root_i
+            if rank[root_i] == rank[root_j]:
+                rank[root_i] += 1
+        
+        # Tracks sharing an endpoint are connected outright
+        for i, j in track_edges:
+            union(i, j)
+        
+        # The remaining candidates need a HitTest to confirm the connection
+        for i, j in candidate_pairs:
+            if find(i) == find(j):
+                continue  # Already in the same group
+            if self.are_physically_connected(board, all_items[i], all_items[j], kinds[i], kinds[j],
+                                             endpoints[i], endpoints[j], hittest_cache):
+                union(i, j)
+        
+        # Give each group a dense id in order of first appearance, then fill
+        # the groups by list index in a single pass
+        group_ids = {}
+        item_group_ids = [group_ids.setdefault(root, len(group_ids))
+                          for root in map(find, range(len(all_items)))]
+        connected_groups = [[] for _ in range(len(group_ids))]
+        for item, group_id in zip(all_items, item_group_ids):
+            connected_groups[group_id].append(item)
                 
         return connected_groups
 
-    def get_item_id(self, item):
-        """Generate a unique ID for each item"""
-        return str(id(item))  # Use Python's object id to ensure uniqueness
+    def get_track_endpoints(self, track):
+        """Return the start and end points of a track as (x, y) tuples"""
+        start, end = track.GetStart(), track.GetEnd()
+        return (start.x, start.y), (end.x, end.y)
+
+    def get_item_bbox(self, item, track_endpoints=None):
+        """Return the (left, top, right, bottom) bounding box of an item"""
+        if track_endpoints is not None:
+            # Tracks are bounded by their endpoints, expanded by half the width
+            (start_x, start_y), (end_x, end_y) = track_endpoints
+            half_width = item.GetWidth() // 2
+            return (min(start_x, end_x) - half_width, min(start_y, end_y) - half_width,
+                    max(start_x, end_x) + half_width, max(start_y, end_y) + half_width)
+        
+        # Pads and zones report their own bounding box, grown by the HitTest tolerance
+        bbox = item.GetBoundingBox()
+        return (bbox.GetLeft() - HITTEST_MARGIN, bbox.GetTop() - HITTEST_MARGIN,
+                bbox.GetRight() + HITTEST_MARGIN, bbox.GetBottom() + HITTEST_MARGIN)
 
-    def are_physically_connected(self, board, item1, item2):
+    def build_spatial_index(self, bboxes):
+        """Build a uniform grid mapping each (col, row) cell to the indices of the items it overlaps"""
+        cell = GRID_CELL_SIZE
+        grid = defaultdict(list)
+        for idx, (left, top, right, bottom) in enumerate(bboxes):
+            for col in range(left // cell, right // cell + 1):
+                for row in range(top // cell, bottom // cell + 1):
+                    grid[(col, row)].append(idx)
+        return grid
+
+    def query_spatial_index(self, grid, bbox, after=-1):
+        """Return the indices above `after` of items sharing at least one grid cell with a bounding box"""
+        cell = GRID_CELL_SIZE
+        left, top, right, bottom = bbox
+        candidates = set()
+        for col in range(left // cell, right // cell + 1):
+            for row in range(top // cell, bottom // cell + 1):
+                cell_items = grid.get((col, row))
+                if cell_items:
+                    # Cells list indices in ascending order, so skip straight past `after`
+                    candidates.update(cell_items[bisect.bisect_right(cell_items, after):])
+        return candidates
+
+    def bboxes_overlap(self, bbox1, bbox2):
+        """Check whether two (left, top, right, bottom) bounding boxes intersect"""
+        return (bbox1[0] <= bbox2[2] and bbox2[0] <= bbox1[2] and
+                bbox1[1] <= bbox2[3] and bbox2[1] <= bbox1[3])
+
+    def build_edges(self, kinds, endpoints, bboxes, layers):
+        """Find connected track pairs and the nearby item pairs that still need a HitTest"""
+        # Tracks sharing an endpoint on a common layer land in the same bucket;
+        # vias are bucketed on every copper layer they span, and only once per
+        # layer since their start and end coincide
+        endpoint_map = defaultdict(list)
+        for i, track_endpoints in enumerate(endpoints):
+            if track_endpoints is None:
+                continue
+            for x, y in set(track_endpoints):
+                for layer in layers[i]:
+                    endpoint_map[(x, y, layer)].append(i)
+        
+        track_edges = []
+        for track_indices in endpoint_map.values():
+            for j in track_indices[1:]:
+                track_edges.append((track_indices[0], j))
+        
+        # Test each remaining nearby pair once, looking up only neighbours j > i
+        grid = self.build_spatial_index(bboxes)
+        candidate_pairs = []
+        for i, bbox in enumerate(bboxes):
+            for j in self.query_spatial_index(grid, bbox, after=i):
+                if kinds[i] == kinds[j]:
+                    # Tracks are joined by the endpoint buckets; pads never join
+                    # pads, nor zones zones, so only track/pad, track/zone and
+                    # pad/zone pairs are worth a HitTest
+                    continue
+                if layers[i].isdisjoint(layers[j]):
+                    continue  # Items on different copper layers cannot touch
+                if not self.bboxes_overlap(bbox, bboxes[j]):
+                    continue  # Items whose bounding boxes are apart cannot touch
+                candidate_pairs.append((i, j))
+        
+        return track_edges, candidate_pairs
+
+    def are_physically_connected(self, board, item1, item2, kind1, kind2,
+                                 endpoints1=None, endpoints2=None, hittest_cache=None):
         """Improved physical connection detection"""
-        # For pad-to-track or pad-to-zone connections
-        if isinstance(item1, pcbnew.PAD) or isinstance(item2, pcbnew.PAD):
-            pad = item1 if isinstance(item1, pcbnew.PAD) else item2
-            other = item2 if isinstance(item1, pcbnew.PAD) else item1
-            
-            # Check if the pad is connected to a track
-            if isinstance(other, pcbnew.PCB_TRACK):
-                return pad.HitTest(other.GetStart()) or pad.HitTest(other.GetEnd())
-            # Check if the pad is inside a copper zone
-            elif isinstance(other, pcbnew.ZONE):
-                return other.HitTest(pad.GetPosition())
-        
-        # For track-to-track connections
-        elif isinstance(item1, pcbnew.PCB_TRACK) and isinstance(item2, pcbnew.PCB_TRACK):
-            # Check for shared endpoints
-            return (item1.GetStart() == item2.GetStart() or 
-                    item1.GetStart() == item2.GetEnd() or
-                    item1.GetEnd() == item2.GetStart() or
-                    item1.GetEnd() == item2.GetEnd())
-        
-        # For zone-to-anything connections
-        elif isinstance(item1, pcbnew.ZONE) or isinstance(item2, pcbnew.ZONE):
-            zone = item1 if isinstance(item1, pcbnew.ZONE) else item2
-            other = item2 if isinstance(item1, pcbnew.ZONE) else item1
+        # Order the pair by kind so each combination has a single branch
+        if kind1 > kind2:
+            item1, item2, kind1, kind2 = item2, item1, kind2, kind1
+            endpoints1, endpoints2 = endpoints2, endpoints1
+        
+        if kind1 == KIND_TRACK:
+            # Track-to-track connections are found by the endpoint buckets in build_edges
+            if kind2 == KIND_TRACK:
+                return False
             
-            if isinstance(other, pcbnew.PCB_TRACK):
-                return zone.HitTest(other.GetStart()) or zone.HitTest(other.GetEnd())
-            elif isinstance(other, pcbnew.PAD):
-                return zone.HitTest(other.GetPosition())
+            # Check if the track ends on a pad or inside a copper zone, using the
+            # endpoints extracted during collection
+            start, end = endpoints1 or self.get_track_endpoints(item1)
+            return (self.hit_test(item2, start, hittest_cache) or
+                    self.hit_test(item2, end, hittest_cache))
+        
+        # Check if the pad is inside a copper zone; each pad/zone pair is only
+        # tested once, so there is nothing to cache
+        if kind1 == KIND_PAD and kind2 == KIND_ZONE:
+            return item2.HitTest(item1.GetPosition())
         
         return False
 
+    def hit_test(self, item, point, hittest_cache=None):
+        """HitTest an item at an (x, y) point, reusing earlier results for the same item and point"""
+        if hittest_cache is None:
+            return item.HitTest(pcbnew.VECTOR2I(*point))
+        
+        # Tracks meeting at one point are already joined by the endpoint buckets,
+        # so once one of them hits a pad or zone the others are skipped as being
+        # in the same group; only repeated misses at that point reach the cache
+        key = (id(item), point)
+        hit = hittest_cache.get(key)
+        if hit is None:
+            hit = hittest_cache[key] = bool(item.HitTest(pcbnew.VECTOR2I(*point)))
+        return hit
+
+    def get_netname(self, item):
+        """Return the net name of an item, or an empty string if it has no net"""
+        net = item.GetNet()
+        return net.GetNetname() if net else ""
+
     def get_existing_net(self, items):
         """Check if the connection group already has a net assigned"""
         for item in items: